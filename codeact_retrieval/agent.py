@@ -4,13 +4,75 @@ This class provides a CodeAct agent for the CodeAct framework.
 It allows for the execution of code with persistent state.
 """
 
-import json
-from typing import Any, Dict, List, Optional, Union
+import hashlib
+import types
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Generator, List, NamedTuple, Optional, Union
 
-from litellm import completion
+import diskcache
+import orjson
 
+from codeact_retrieval.utils.anthropic_adapter import (
+    Response,
+    add_history_cache_breakpoint,
+    from_anthropic_response,
+    to_anthropic_messages,
+    to_anthropic_tools,
+)
 from codeact_retrieval.utils.persistent_kernel import PersistentKernel
 
+## Models with these prefixes are sent through the native Anthropic SDK,
+## everything else falls back to litellm.
+ANTHROPIC_MODEL_PREFIXES = ("claude", "anthropic/")
+
+## Upper bound on tool calls executed concurrently for a single turn.
+MAX_TOOL_WORKERS = 8
+
+## Tools that share the persistent kernel; their calls must run in order.
+KERNEL_TOOLS = frozenset({"code_execution"})
+
+## Prefix tools use to report a failure in their string response.
+TOOL_ERROR_PREFIX = "Error:"
+
+## Placeholder prefix for tool outputs elided from the message history.
+ELIDED_PREFIX = "[elided:"
+
+## Returned by the generated dispatcher for unknown tool names.
+_TOOL_NOT_FOUND = object()
+
+## Longest chunk ``content`` kept verbatim in structured tool responses.
+## This only applies to custom tools that return lists of chunk dictionaries;
+## code_execution returns printed text, which is passed through unchanged.
+MAX_TOOL_CHUNK_CHARS = 2000
+TRUNCATED_MARKER = "…[truncated]"
+
+
+def _is_empty(value: Any) -> bool:
+    """Whether a chunk field carries no information (None or an empty str/list/dict)."""
+    return value is None or (isinstance(value, (str, list, dict)) and not value)
+
+
+def _compact_chunk(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop empty fields and truncate long content of a chunk returned by a structured tool."""
+    compact = {key: value for key, value in chunk.items() if not _is_empty(value)}
+    metadata = compact.get("metadata")
+    if isinstance(metadata, dict):
+        compact["metadata"] = {key: value for key, value in metadata.items() if not _is_empty(value)}
+    content = compact.get("content")
+    if isinstance(content, str) and len(content) > MAX_TOOL_CHUNK_CHARS:
+        compact["content"] = content[:MAX_TOOL_CHUNK_CHARS] + TRUNCATED_MARKER
+    return compact
+
+
+class ParsedToolCall(NamedTuple):
+    """Tool call with its JSON arguments parsed exactly once."""
+
+    id: str
+    name: str
+    args: Dict[str, Any]
+    parse_error: Optional[str] = None
+
 
 class Agent:
     """CodeAct Agent for retrieval."""
@@ -28,19 +90,41 @@ class Agent:
             List[Dict[str, Any]]
         ] = None,
         kernel: Optional[PersistentKernel] = None,
+        cache_dir: Optional[str] = ".agent_cache",
+        max_history_tool_msgs: Optional[int] = 4,
+        max_history: Optional[int] = None,
         **kwargs: Any,
     ) -> None:
-        """Initialize the CodeAct Agent."""
+        """Initialize the CodeAct Agent.
+
+        Responses are cached on disk under ``cache_dir`` when ``temperature``
+        is 0; pass ``cache_dir=None`` to disable the cache. Only the last
+        ``max_history_tool_msgs`` tool outputs are kept verbatim in the
+        history; pass ``None`` to keep all of them. With ``max_history`` set,
+        the oldest complete exchanges are evicted once the history grows past
+        that many messages; the system prompt is always kept.
+        """
         self.model = model
         self.api_key = api_key
         self.system_prompt = system_prompt
         self.base_url = base_url
         self.temperature = temperature
         self.max_tokens = max_tokens
-        self.tools = tools
-        self.messages = messages if messages is not None else []
+        self.tools = tools or []
+        self.messages: Deque[Dict[str, Any]] = deque(messages if messages is not None else [])
+        self._max_history = max_history
+        ## Tool messages in self.messages not yet elided, oldest first
+        self._tool_msg_indices: Deque[Dict[str, Any]] = deque(
+            message for message in self.messages if message.get("role") == "tool"
+        )
+        ## User messages in self.messages, each starting an exchange that can be evicted
+        self._user_msg_indices: Deque[Dict[str, Any]] = deque(
+            message for message in self.messages if message.get("role") == "user"
+        )
         self.kwargs = kwargs
         self.kernel = kernel
+        self._cache = diskcache.Cache(cache_dir) if cache_dir else None
+        self._max_history_tool_msgs = max_history_tool_msgs
         ## Create a mapping of tool names to their callable functions
         self._tool_functions = {}
         for tool in self.tools:
@@ -50,6 +134,29 @@ class Agent:
                 callable_func = func_info.get("callable")
                 if name and callable_func:
                     self._tool_functions[name] = callable_func
+        self._dispatch = self._build_dispatcher()
+
+        ## Create clean tool definitions without callable functions for API
+        self._clean_tools = []
+        for tool in self.tools:
+            if tool.get("type") == "function":
+                func_info = tool.get("function", {})
+                clean_tool = {
+                    "type": "function",
+                    "function": {
+                        "name": func_info.get("name"),
+                        "description": func_info.get("description", ""),
+                        "parameters": func_info.get("parameters", {}),
+                    },
+                }
+                self._clean_tools.append(clean_tool)
+        self._anthropic_tools = to_anthropic_tools(self._clean_tools)
+
+        ## Provider clients are imported and built on first use to keep startup fast
+        self._is_anthropic = model.startswith(ANTHROPIC_MODEL_PREFIXES)
+        self._client = None
+        self._completion = None
+        self._stream_chunk_builder = None
 
     ## Query the agent with the provided user prompt.
     ## Continues conversation until final response is received.
@@ -58,14 +165,27 @@ class Agent:
         Query the agent with the provided user prompt.
         Continues conversation until final response is received.
         """
+        stream = self.query_stream(user_prompt)
+        while True:
+            try:
+                next(stream)
+            except StopIteration as stop:
+                return stop.value
+
+    ## Query the agent, yielding response text as it is generated.
+    def query_stream(self, user_prompt: str) -> Generator[str, None, Dict[str, Any]]:
+        """
+        Query the agent, yielding response text as it is generated.
+        Tool call turns are buffered until complete before tools run.
+        The final response dict is returned when the generator finishes.
+        """
         self._set_system_prompt(self.system_prompt)
-        self.messages.append({"role": "user", "content": user_prompt})
+        self._append({"role": "user", "content": user_prompt})
 
         # Continue conversation loop until we get a final response
         while True:
-            response = self._make_api_call()
-            print("Response: ", response.get("content"))
-            self.messages.append(response.choices[0].message.model_dump())
+            response = yield from self._make_api_call()
+            self._append(self._assistant_message(response.choices[0].message))
 
             # If there are tool calls, process them and continue
             if response.choices[0].message.tool_calls:
@@ -78,114 +198,356 @@ class Agent:
                 "tool_calls": response.choices[0].message.tool_calls or None,
             }
 
+    ## Execute parsed tool calls, returning responses in call order.
+    def _run_tool_calls(self, parsed_calls: List[ParsedToolCall]) -> List[Dict[str, Any]]:
+        """
+        Execute parsed tool calls, returning responses in call order.
+        Calls that share the kernel run one after another in the order the
+        model issued them; only independent tools run concurrently.
+        """
+        tool_call_responses: List[Optional[Dict[str, Any]]] = [None] * len(parsed_calls)
+        pooled = [index for index, call in enumerate(parsed_calls) if call.name not in KERNEL_TOOLS]
+        executor = None
+        futures = {}
+        if len(pooled) > 1:
+            executor = ThreadPoolExecutor(max_workers=min(MAX_TOOL_WORKERS, len(pooled)))
+            futures = {index: executor.submit(self._execute_tool_call, parsed_calls[index]) for index in pooled}
+
+        try:
+            for index, parsed_call in enumerate(parsed_calls):
+                if index not in futures:
+                    tool_call_responses[index] = self._execute_tool_call(parsed_call)
+            for index, future in futures.items():
+                tool_call_responses[index] = future.result()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return tool_call_responses
+
+    ## Build the history entry for an assistant message.
+    def _assistant_message(self, message: Any) -> Dict[str, Any]:
+        """
+        Build the history entry for an assistant message.
+        Reads only the fields the conversation needs instead of dumping the
+        whole response model, and skips empty fields.
+        """
+        assistant: Dict[str, Any] = {"role": "assistant"}
+        if message.content is not None:
+            assistant["content"] = message.content
+        if message.tool_calls:
+            assistant["tool_calls"] = [
+                {
+                    "id": tool_call.id,
+                    "type": "function",
+                    "function": {
+                        "name": tool_call.function.name,
+                        "arguments": tool_call.function.arguments,
+                    },
+                }
+                for tool_call in message.tool_calls
+            ]
+        elif "content" not in assistant:
+            assistant["content"] = ""
+        return assistant
+
     ## Process multiple tool calls and add their responses to messages.
     def _process_tool_calls(self, tool_calls: List[Any]) -> None:
         """
         Process multiple tool calls and add their responses to messages.
         """
-        for tool_call in tool_calls:
-            # Parse and display arguments
-            try:
-                args = json.loads(tool_call.function.arguments)
-                # Print the code being executed instead of arguments
-                if tool_call.function.name == "code_execution" and "code" in args:
-                    print(f"\nExecuting Code:\n{args['code']}\n")
-                else:
-                    print(f"Arguments: {args}")
-            except json.JSONDecodeError:
+        parsed_calls = [self._parse_tool_call(tool_call) for tool_call in tool_calls]
+        for parsed_call in parsed_calls:
+            # Display arguments
+            if parsed_call.parse_error is not None:
                 print("Failed to parse arguments")
+            # Print the code being executed instead of arguments
+            elif parsed_call.name == "code_execution" and "code" in parsed_call.args:
+                print(f"\nExecuting Code:\n{parsed_call.args['code']}\n")
+            else:
+                print(f"Arguments: {parsed_call.args}")
 
-            tool_call_response = self._execute_tool_call(tool_call)
+        tool_call_responses = self._run_tool_calls(parsed_calls)
 
-            # Show execution result status - check if it's an actual error message
-            response_str = str(tool_call_response["tool_response"])
-            if (
-                response_str.startswith("Error:")
-                or response_str.startswith("Error executing tool")
-                or response_str.startswith("Error parsing tool arguments")
-            ):
+        for parsed_call, tool_call_response in zip(parsed_calls, tool_call_responses):
+            # Show execution result status
+            response_str = self._serialize_tool_response(tool_call_response["tool_response"])
+            if not tool_call_response["ok"]:
                 print(f"Failed: {tool_call_response['tool_response']}")
             else:
                 # Print the output from code execution (e.g., JSON results)
-                if tool_call.function.name == "code_execution" and tool_call_response["tool_response"]:
+                if parsed_call.name == "code_execution" and tool_call_response["tool_response"]:
                     # print(tool_call_response["tool_response"])
                     print()  # Blank line after output for consistency
 
-            self.messages.append(
+            self._append(
                 {
                     "role": "tool",
                     "tool_call_id": tool_call_response["tool_call_id"],
                     "name": tool_call_response["tool_name"],
-                    "content": str(tool_call_response["tool_response"]),
+                    "content": response_str,
                 }
             )
 
-    ## Make an API call to the OpenAI client.
-    def _make_api_call(self) -> Any:
+        self._elide_tool_history(len(tool_call_responses))
+
+    ## Serialize a tool response into message content.
+    def _serialize_tool_response(self, tool_response: Any) -> str:
         """
-        Make an API call to the OpenAI client.
+        Serialize a tool response into message content.
+        Structured (non-string) responses from custom tools are sent as compact
+        JSON rather than Python repr, with empty fields dropped and long chunk
+        content truncated. String responses, such as code_execution output,
+        are passed through unchanged.
         """
-        # Create clean tool definitions without callable functions for API
-        clean_tools = []
-        for tool in self.tools:
-            if tool.get("type") == "function":
-                func_info = tool.get("function", {})
-                clean_tool = {
-                    "type": "function",
-                    "function": {
-                        "name": func_info.get("name"),
-                        "description": func_info.get("description", ""),
-                        "parameters": func_info.get("parameters", {}),
-                    },
-                }
-                clean_tools.append(clean_tool)
+        if isinstance(tool_response, str):
+            return tool_response
+        if isinstance(tool_response, list):
+            # Custom structured tools returning chunk dictionaries with large content fields
+            tool_response = [_compact_chunk(item) if isinstance(item, dict) else item for item in tool_response]
+        try:
+            return orjson.dumps(tool_response, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits; never fail the turn over serialization
+            return str(tool_response)
+
+    ## Append a message to the history, indexing tool messages.
+    def _append(self, message: Dict[str, Any]) -> None:
+        """
+        Append a message to the history, indexing tool messages.
+        """
+        if message.get("role") == "tool":
+            self._tool_msg_indices.append(message)
+        elif message.get("role") == "user":
+            self._user_msg_indices.append(message)
+        self.messages.append(message)
+        self._evict_history()
+
+    ## Evict the oldest complete exchanges once the history is too long.
+    def _evict_history(self) -> None:
+        """
+        Evict the oldest complete exchanges once the history is too long.
+        Whole exchanges (a user message up to the next one) are dropped so
+        tool results never lose their tool calls. The system message stays
+        pinned at index 0, and the current exchange is never evicted.
+        """
+        if self._max_history is None:
+            return
+
+        pinned = 1 if self.messages and self.messages[0].get("role") == "system" else 0
+        while len(self.messages) > self._max_history and len(self._user_msg_indices) > 1:
+            system_message = self.messages.popleft() if pinned else None
+            self._user_msg_indices.popleft()
+            next_exchange = self._user_msg_indices[0]
+            while self.messages[0] is not next_exchange:
+                message = self.messages.popleft()
+                if self._tool_msg_indices and self._tool_msg_indices[0] is message:
+                    self._tool_msg_indices.popleft()
+            if system_message is not None:
+                self.messages.appendleft(system_message)
+
+    ## Replace all but the most recent tool outputs with a short placeholder.
+    def _elide_tool_history(self, current_turn: int) -> None:
+        """
+        Replace all but the most recent tool outputs with a short placeholder.
+        Keeps per-turn input size bounded as the conversation grows, while
+        the system prompt prefix stays untouched for prompt caching. The last
+        ``current_turn`` outputs belong to the current turn and are kept,
+        since the model has not seen them yet.
+        """
+        if self._max_history_tool_msgs is None:
+            return
 
-        return completion(
+        # Elided messages are reached through their references, without indexing into the deque
+        while len(self._tool_msg_indices) > max(self._max_history_tool_msgs, current_turn):
+            message = self._tool_msg_indices.popleft()
+            content = message.get("content") or ""
+            if not content.startswith(ELIDED_PREFIX):
+                message["content"] = f"{ELIDED_PREFIX} {len(content.encode())} bytes of prior tool output]"
+
+    ## Make an API call, serving deterministic requests from the disk cache.
+    def _make_api_call(self) -> Generator[str, None, Any]:
+        """
+        Make an API call, serving deterministic requests from the disk cache.
+        Yields response text as it streams and returns the full response.
+        """
+        if self._cache is None or self.temperature != 0:
+            return (yield from self._call_provider())
+
+        key = self._cache_key()
+        cached = self._cache.get(key)
+        if cached is not None:
+            response = Response.from_dict(cached)
+            if response.choices[0].message.content:
+                yield response.choices[0].message.content
+            return response
+
+        response = yield from self._call_provider()
+        self._cache[key] = response.model_dump()
+        return response
+
+    ## Hash the request body into a cache key.
+    def _cache_key(self) -> str:
+        """
+        Hash the request body into a cache key.
+        """
+        payload = orjson.dumps(
+            {
+                "model": self.model,
+                "messages": list(self.messages),
+                "tools": self._clean_tools,
+                "temperature": self.temperature,
+                "max_tokens": self.max_tokens,
+            },
+            option=orjson.OPT_SORT_KEYS,
+            default=str,
+        )
+        return hashlib.sha256(payload).hexdigest()
+
+    ## Stream an API call from the model provider.
+    def _call_provider(self) -> Generator[str, None, Any]:
+        """
+        Stream an API call from the model provider.
+        Yields response text as it arrives and returns the assembled response.
+        """
+        if self._is_anthropic:
+            return (yield from self._make_anthropic_api_call())
+
+        if self._completion is None:
+            from litellm import completion, stream_chunk_builder
+
+            self._completion = completion
+            self._stream_chunk_builder = stream_chunk_builder
+
+        chunks = []
+        for chunk in self._completion(
             model=self.model,
-            messages=self.messages,  # type: ignore
+            messages=list(self.messages),  # type: ignore
             temperature=self.temperature,
             max_completion_tokens=self.max_tokens,
-            tools=clean_tools if clean_tools else None,
-        )
+            tools=self._clean_tools or None,
+            stream=True,
+        ):
+            chunks.append(chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+        return self._stream_chunk_builder(chunks, messages=list(self.messages))
+
+    ## Stream an API call through the native Anthropic client.
+    def _make_anthropic_api_call(self) -> Generator[str, None, Any]:
+        """
+        Stream an API call through the native Anthropic client.
+        """
+        system, messages = to_anthropic_messages(self.messages)
+        add_history_cache_breakpoint(messages)
+        request: Dict[str, Any] = {
+            "model": self.model.split("/", 1)[-1],
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+        if system:
+            request["system"] = system
+        if self._anthropic_tools:
+            request["tools"] = self._anthropic_tools
+
+        with self._get_anthropic_client().messages.stream(**request) as stream:
+            for text in stream.text_stream:
+                yield text
+            return from_anthropic_response(stream.get_final_message())
+
+    ## Generate a dispatcher specialized to this agent's fixed tool set.
+    def _build_dispatcher(self) -> Callable[[str, Dict[str, Any]], Any]:
+        """
+        Generate a dispatcher specialized to this agent's fixed tool set.
+        The tools never change after init, so each one gets a direct branch
+        in a compiled if-ladder instead of a mapping lookup per call.
+        """
+        namespace: Dict[str, Any] = {"_TOOL_NOT_FOUND": _TOOL_NOT_FOUND}
+        lines = ["def _dispatch(self, name, args):"]
+        for index, (name, tool_function) in enumerate(self._tool_functions.items()):
+            function_name = f"_tool_{index}"
+            namespace[function_name] = tool_function
+            lines.append(f"    {'if' if index == 0 else 'elif'} name == {name!r}:")
+            if name == "code_execution":
+                lines.append(f"        return {function_name}(kernel=self.kernel, **args)")
+            else:
+                lines.append(f"        return {function_name}(**args)")
+        lines.append("    return _TOOL_NOT_FOUND")
+
+        exec(compile("\n".join(lines), "<agent-dispatch>", "exec"), namespace)
+        return types.MethodType(namespace["_dispatch"], self)
+
+    ## Parse the JSON arguments of a tool call.
+    def _parse_tool_call(self, tool_call: Any) -> ParsedToolCall:
+        """
+        Parse the JSON arguments of a tool call.
+        """
+        try:
+            args = orjson.loads(tool_call.function.arguments)
+        except orjson.JSONDecodeError as e:
+            return ParsedToolCall(tool_call.id, tool_call.function.name, {}, str(e))
+        if not isinstance(args, dict):
+            return ParsedToolCall(tool_call.id, tool_call.function.name, {}, "arguments must be a JSON object")
+        return ParsedToolCall(tool_call.id, tool_call.function.name, args)
+
+    ## Get the Anthropic client, creating it on first use.
+    def _get_anthropic_client(self) -> Any:
+        """
+        Get the Anthropic client, creating it on first use.
+        A single pooled HTTP/2 client is reused across turns.
+        """
+        if self._client is None:
+            import anthropic
+            import httpx
+
+            self._client = anthropic.Anthropic(
+                api_key=self.api_key,
+                http_client=httpx.Client(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+                ),
+            )
+        return self._client
 
     ## Execute a single tool call and return the response.
-    def _execute_tool_call(self, tool_call: Any) -> Dict[str, Any]:
+    def _execute_tool_call(self, parsed_call: ParsedToolCall) -> Dict[str, Any]:
         """
         Execute a single tool call and return the response.
         """
-        tool_call_id = tool_call.id
-        tool_name = tool_call.function.name
+        tool_call_id = parsed_call.id
+        tool_name = parsed_call.name
 
-        try:
-            if tool_name == "code_execution":
-                tool_args = json.loads(tool_call.function.arguments)
-                tool_args["kernel"] = self.kernel
-            else:
-                tool_args = json.loads(tool_call.function.arguments)
-        except json.JSONDecodeError as e:
+        if parsed_call.parse_error is not None:
             return {
                 "tool_call_id": tool_call_id,
                 "tool_name": tool_name,
                 "tool_args": {},
-                "tool_response": f"Error parsing tool arguments: {str(e)}",
+                "tool_response": f"Error parsing tool arguments: {parsed_call.parse_error}",
+                "ok": False,
             }
 
-        # Get the tool function from our mapping
-        tool_function = self._tool_functions.get(tool_name)
-
-        if tool_function is None:
-            tool_response = f"Error: Tool '{tool_name}' not found"
+        tool_args = parsed_call.args
+        try:
+            tool_response = self._dispatch(tool_name, tool_args)
+        except (TypeError, ValueError, AttributeError, RuntimeError) as e:
+            tool_response = f"Error executing tool '{tool_name}': {str(e)}"
+            ok = False
         else:
-            try:
-                tool_response = tool_function(**tool_args)
-            except (TypeError, ValueError, AttributeError, RuntimeError) as e:
-                tool_response = f"Error executing tool '{tool_name}': {str(e)}"
+            if tool_response is _TOOL_NOT_FOUND:
+                tool_response = f"Error: Tool '{tool_name}' not found"
+                ok = False
+            else:
+                # Tools such as code_execution report failures as "Error: ..." strings
+                ok = not (isinstance(tool_response, str) and tool_response.startswith(TOOL_ERROR_PREFIX))
 
         return {
             "tool_call_id": tool_call_id,
             "tool_name": tool_name,
             "tool_args": tool_args,
             "tool_response": tool_response,
+            "ok": ok,
         }
 
     ## Set the system prompt for the agent if not already set.
@@ -193,7 +555,32 @@ class Agent:
         """
         Set the system prompt for the agent if not already set.
         """
+        system_message = {"role": "system", "content": self._system_content(system_prompt)}
         if not self.messages:
-            self.messages.append({"role": "system", "content": system_prompt})
+            self.messages.append(system_message)
         elif self.messages[0].get("role") != "system":
-            self.messages.insert(0, {"role": "system", "content": system_prompt})
+            self.messages.appendleft(system_message)
+
+    ## Build the system message content, marking it cacheable for Anthropic.
+    def _system_content(self, system_prompt: str) -> Any:
+        """
+        Build the system message content, marking it cacheable for Anthropic.
+
+        The system prompt is static, so Anthropic prompt caching can reuse it
+        across turns once the cached prefix (tools plus system) reaches the
+        model's minimum cacheable length, 1024 tokens for Sonnet. The shipped
+        prompt is about 750 tokens and only clears it together with the
+        code_execution tool, so a second breakpoint at the end of the history
+        keeps caching effective for shorter prompts or fewer tools.
+        Retrieval output must stay in tool messages, never in this block, or
+        the cached prefix would change every turn.
+        """
+        if not self._is_anthropic:
+            return system_prompt
+        return [
+            {
+                "type": "text",
+                "text": system_prompt,
+                "cache_control": {"type": "ephemeral"},
+            }
+        ]
@@ -1,6 +1,7 @@
 """Functions for retrieval agent."""
-from codeact_retrieval.functions.search import code_search
+from codeact_retrieval.functions.search import code_search, code_search_many
 FUNCTIONS = {
     "code_search": code_search,
+    "code_search_many": code_search_many,
 }
 __all__ = ["FUNCTIONS"]
\ No newline at end of file
@@ -1,11 +1,142 @@
 """Search function for retrieval agent."""
+import copy
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+
 from codeact_retrieval.repository_singleton import get_repository
 
+## Maximum number of (repository, query, top_k) results kept in the search cache.
+SEARCH_CACHE_SIZE = 1024
+## Upper bound on searches run concurrently when queries cannot be embedded in one batch.
+MAX_SEARCH_WORKERS = 8
+
+_search_cache: "OrderedDict[Tuple[Any, str, int], list]" = OrderedDict()
+_search_cache_lock = threading.Lock()
+
+
+def _normalize_query(query: str) -> str:
+    """Normalize a query so trivial variants share a cache entry."""
+    return sys.intern(query.strip().lower())
+
+
+def _cache_get(key: Tuple[Any, str, int]) -> Optional[list]:
+    """Return cached results for a key, marking them recently used."""
+    with _search_cache_lock:
+        results = _search_cache.get(key)
+        if results is not None:
+            _search_cache.move_to_end(key)
+        return results
+
+
+def _cache_put(key: Tuple[Any, str, int], results: list) -> None:
+    """Store results for a key, evicting the least recently used entry when full."""
+    with _search_cache_lock:
+        _search_cache[key] = results
+        if len(_search_cache) > SEARCH_CACHE_SIZE:
+            _search_cache.popitem(last=False)
+
+
+def _cached_search(repository: Any, query: str, top_k: int) -> list:
+    """Search the repository, memoized per (repository, normalized query, top_k).
+
+    The normalized query is only the cache key; the search itself uses the
+    original (stripped) text so identifiers keep their casing. The returned
+    list is the cached one and must not be handed out without copying.
+    """
+    query = query.strip()
+    key = (repository, _normalize_query(query), top_k)
+    results = _cache_get(key)
+    if results is None:
+        results = repository.search(query, top_k=top_k)
+        _cache_put(key, results)
+    return results
+
+
+def _supports_batched_embedding(repository: Any) -> bool:
+    """Whether all queries can be embedded in one embedder call.
+
+    HyDE rewrites every query with its own LLM call first, so those
+    repositories keep the per-query search path.
+    """
+    return (
+        hasattr(repository, "embedder")
+        and hasattr(repository, "vector_store")
+        and not getattr(repository, "use_hyde", False)
+    )
+
+
+def _batched_search(repository: Any, queries: List[str], top_k: int) -> List[list]:
+    """Search several queries with one batched embedding call, mirroring Repository.search."""
+    embeddings = repository.embedder.embed(queries)
+    batches = []
+    for query, embedding in zip(queries, embeddings):
+        results = repository.vector_store.search(query_embedding=embedding, top_k=top_k)
+        if getattr(repository, "use_reranking", False) and len(results) > 1:
+            results = repository.rerank_documents(query, results)
+        batches.append(results)
+    return batches
+
+
 def code_search(query: str, top_k: int = 5) -> list:
     """Search for code related to the query and returns a list of result dictionaries."""
     # Get the singleton repository instance
     repository = get_repository()
-    # Search for code
-    results = repository.search(query, top_k=top_k)
-   
-    return results
\ No newline at end of file
+    # Search for code, reusing results for repeated queries
+    results = _cached_search(repository, query, top_k)
+
+    # Copy so callers can modify results without corrupting the cache
+    return copy.deepcopy(results)
+
+
+def code_search_batch(queries: List[str], top_k: int = 5) -> List[list]:
+    """Search for several queries at once and return one result list per query.
+
+    Uncached queries are embedded together in a single embedder call when the
+    repository allows it, and otherwise searched concurrently.
+    """
+    repository = get_repository()
+    # Trivial variants of a query are searched once, using the first stripped spelling seen
+    unique_queries: Dict[str, str] = {}
+    for query in queries:
+        unique_queries.setdefault(_normalize_query(query), query.strip())
+
+    results_by_key = {}
+    missing = {}
+    for normalized, query in unique_queries.items():
+        results = _cache_get((repository, normalized, top_k))
+        if results is None:
+            missing[normalized] = query
+        else:
+            results_by_key[normalized] = results
+
+    if len(missing) > 1 and _supports_batched_embedding(repository):
+        batch_results = _batched_search(repository, list(missing.values()), top_k)
+        for normalized, results in zip(missing, batch_results):
+            _cache_put((repository, normalized, top_k), results)
+            results_by_key[normalized] = results
+    elif len(missing) > 1:
+        search = partial(_cached_search, repository, top_k=top_k)
+        with ThreadPoolExecutor(max_workers=min(MAX_SEARCH_WORKERS, len(missing))) as executor:
+            results_by_key.update(zip(missing, executor.map(search, missing.values())))
+    else:
+        for normalized, query in missing.items():
+            results_by_key[normalized] = _cached_search(repository, query, top_k)
+
+    return [copy.deepcopy(results_by_key[_normalize_query(query)]) for query in queries]
+
+
+def code_search_many(queries: List[str], top_k: int = 5) -> list:
+    """Search for several queries in one batched call and return all results, in query order.
+
+    Each result carries a ``'query'`` field naming the query that produced it.
+    """
+    batches = code_search_batch(queries, top_k)
+    # Batch results are already per-query copies, so they can be tagged in place
+    for query, batch in zip(queries, batches):
+        for result in batch:
+            result["query"] = query
+    return [result for batch in batches for result in batch]
@@ -1,7 +1,13 @@
 """Singleton pattern for Repository management."""
+import threading
 from typing import Optional
 from coderag import Repository
 
+## Guards singleton creation and initialization
+_LOCK = threading.Lock()
+## Initialized repository, read lock-free by get_repository()
+_REPO: Optional[Repository] = None
+
 
 class RepositorySingleton:
     """Singleton class to manage a single Repository instance."""
@@ -11,7 +17,9 @@ class RepositorySingleton:
     
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
+            with _LOCK:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
         return cls._instance
     
     def initialize(self, repository: Repository) -> None:
@@ -20,7 +28,10 @@ class RepositorySingleton:
         Args:
             repository: The Repository instance to use
         """
-        self._repository = repository
+        global _REPO
+        with _LOCK:
+            self._repository = repository
+            _REPO = repository
     
     def get_repository(self) -> Repository:
         """Get the Repository instance.
@@ -40,9 +51,12 @@ class RepositorySingleton:
     @classmethod
     def reset(cls) -> None:
         """Reset the singleton instance (useful for testing)."""
-        cls._instance = None
-        if cls._instance:
-            cls._instance._repository = None
+        global _REPO
+        with _LOCK:
+            if cls._instance:
+                cls._instance._repository = None
+            cls._instance = None
+            _REPO = None
 
 
 # Global accessor function for convenience
@@ -55,4 +69,7 @@ def get_repository() -> Repository:
     Raises:
         RuntimeError: If repository has not been initialized
     """
+    repository = _REPO
+    if repository is not None:
+        return repository
     return RepositorySingleton().get_repository()
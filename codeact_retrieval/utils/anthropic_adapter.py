@@ -0,0 +1,218 @@
+"""Anthropic adapter for CodeAct framework.
+
+The agent keeps its conversation history in the OpenAI/litellm message format.
+This module converts that history into the shape expected by the native
+Anthropic Messages API and converts responses back, so the rest of the agent
+can keep working with ``response.choices[0].message``.
+"""
+
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+
+@dataclass
+class Function:
+    """Function part of a tool call."""
+
+    name: str
+    arguments: str
+
+
+@dataclass
+class ToolCall:
+    """Tool call requested by the model."""
+
+    id: str
+    function: Function
+    type: str = "function"
+
+
+@dataclass
+class Message:
+    """Assistant message returned by the model."""
+
+    content: Optional[str] = None
+    tool_calls: Optional[List[ToolCall]] = None
+    role: str = "assistant"
+
+
+@dataclass
+class Choice:
+    """Single completion choice."""
+
+    message: Message
+    finish_reason: Optional[str] = None
+    index: int = 0
+
+
+@dataclass
+class Response:
+    """Completion response shaped like a litellm ``ModelResponse``."""
+
+    choices: List[Choice]
+    model: str = ""
+    usage: Dict[str, Any] = field(default_factory=dict)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Dictionary-style attribute access, mirroring litellm."""
+        return getattr(self, key, default)
+
+    def model_dump(self) -> Dict[str, Any]:
+        """Return the response as a plain dictionary."""
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Response":
+        """Rebuild a response from a ``model_dump()`` of this or a litellm response."""
+        choices = []
+        for choice in data.get("choices", []):
+            message = choice.get("message") or {}
+            tool_calls = [
+                ToolCall(
+                    id=tool_call["id"],
+                    function=Function(
+                        name=tool_call["function"]["name"],
+                        arguments=tool_call["function"]["arguments"],
+                    ),
+                )
+                for tool_call in message.get("tool_calls") or []
+            ]
+            choices.append(
+                Choice(
+                    message=Message(
+                        content=message.get("content"),
+                        tool_calls=tool_calls or None,
+                    ),
+                    finish_reason=choice.get("finish_reason"),
+                    index=choice.get("index", 0),
+                )
+            )
+        return cls(choices=choices, model=data.get("model", ""), usage=data.get("usage") or {})
+
+
+## Map Anthropic stop reasons to OpenAI finish reasons.
+_FINISH_REASONS = {
+    "end_turn": "stop",
+    "stop_sequence": "stop",
+    "max_tokens": "length",
+    "tool_use": "tool_calls",
+}
+
+
+def to_anthropic_tools(tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Convert OpenAI-style tool definitions into Anthropic tool definitions."""
+    return [
+        {
+            "name": tool["function"]["name"],
+            "description": tool["function"].get("description", ""),
+            "input_schema": tool["function"].get("parameters", {}),
+        }
+        for tool in tools
+    ]
+
+
+def to_anthropic_messages(
+    messages: List[Dict[str, Any]],
+) -> Tuple[Any, List[Dict[str, Any]]]:
+    """Split OpenAI-style messages into an Anthropic system prompt and messages.
+
+    Tool results become ``tool_result`` blocks on a user turn; consecutive tool
+    results are merged into a single user turn as the Messages API requires.
+    Empty assistant replies are dropped, since the API rejects empty content
+    on non-final assistant turns, and the user turns around them are merged.
+    """
+    system: Any = None
+    converted: List[Dict[str, Any]] = []
+
+    for message in messages:
+        role = message.get("role")
+        if role == "system":
+            system = message.get("content")
+        elif role == "tool":
+            block = {
+                "type": "tool_result",
+                "tool_use_id": message["tool_call_id"],
+                "content": message.get("content") or "",
+            }
+            if converted and converted[-1]["role"] == "user" and isinstance(converted[-1]["content"], list):
+                converted[-1]["content"].append(block)
+            else:
+                converted.append({"role": "user", "content": [block]})
+        elif role == "assistant":
+            content: List[Dict[str, Any]] = []
+            if message.get("content"):
+                content.append({"type": "text", "text": message["content"]})
+            for tool_call in message.get("tool_calls") or []:
+                content.append(
+                    {
+                        "type": "tool_use",
+                        "id": tool_call["id"],
+                        "name": tool_call["function"]["name"],
+                        "input": json.loads(tool_call["function"]["arguments"] or "{}"),
+                    }
+                )
+            if content:
+                converted.append({"role": "assistant", "content": content})
+        elif role == "user" and converted and converted[-1]["role"] == "user":
+            previous = converted[-1]
+            if not isinstance(previous["content"], list):
+                previous["content"] = [{"type": "text", "text": previous["content"]}]
+            text = message.get("content")
+            if isinstance(text, list):
+                previous["content"].extend(text)
+            else:
+                previous["content"].append({"type": "text", "text": text})
+        else:
+            converted.append({"role": role, "content": message.get("content")})
+
+    return system, converted
+
+
+def add_history_cache_breakpoint(messages: List[Dict[str, Any]]) -> None:
+    """Mark the last block of converted messages as a prompt cache breakpoint.
+
+    The cached prefix then covers the whole history, which passes the minimum
+    cacheable length after a few turns even when the system prompt alone is
+    too short to be cached. The block is copied so history is never mutated.
+    """
+    if not messages:
+        return
+    last = messages[-1]
+    content = last["content"]
+    if isinstance(content, str):
+        if not content:
+            return
+        content = [{"type": "text", "text": content}]
+    if not content:
+        return
+    last["content"] = [*content[:-1], {**content[-1], "cache_control": {"type": "ephemeral"}}]
+
+
+def from_anthropic_response(response: Any) -> Response:
+    """Convert a native Anthropic ``Message`` into a litellm-shaped ``Response``."""
+    text_parts = []
+    tool_calls = []
+    for block in response.content:
+        if block.type == "text":
+            text_parts.append(block.text)
+        elif block.type == "tool_use":
+            tool_calls.append(
+                ToolCall(
+                    id=block.id,
+                    function=Function(name=block.name, arguments=json.dumps(block.input)),
+                )
+            )
+
+    message = Message(
+        content="".join(text_parts) or None,
+        tool_calls=tool_calls or None,
+    )
+    return Response(
+        choices=[Choice(message=message, finish_reason=_FINISH_REASONS.get(response.stop_reason))],
+        model=response.model,
+        usage={
+            "prompt_tokens": response.usage.input_tokens,
+            "completion_tokens": response.usage.output_tokens,
+        },
+    )
@@ -0,0 +1,36 @@
+"""Numba helpers for the CodeAct persistent kernel.
+
+These helpers are compiled ahead of time with explicit signatures and
+``cache=True``, so the JIT cost is paid once per machine rather than on the
+first call in every session. They are injected into the kernel namespace
+when the kernel imports numba.
+"""
+import numpy as np
+from numba import float64, int64, njit
+
+
+@njit(int64[:](int64[:]), cache=True)
+def dedup_hashes(hashes):
+    """Return the indices of the first occurrence of each hash, in order."""
+    n = hashes.shape[0]
+    # Stable sort keeps the earliest index first within each run of equal hashes
+    order = np.argsort(hashes, kind="mergesort")
+    first = np.ones(n, dtype=np.bool_)
+    for i in range(1, n):
+        if hashes[order[i]] == hashes[order[i - 1]]:
+            first[i] = False
+    return np.sort(order[first])
+
+
+@njit(int64[:](float64[:], int64), cache=True)
+def merge_topk(scores, k):
+    """Return the indices of the ``k`` highest scores, best first; none if ``k <= 0``."""
+    order = np.argsort(-scores)
+    # A negative k would otherwise slice from the end and drop the best scores
+    return order[: max(min(k, scores.shape[0]), 0)]
+
+
+HELPERS = {
+    "dedup_hashes": dedup_hashes,
+    "merge_topk": merge_topk,
+}
@@ -3,12 +3,102 @@
 This class provides a persistent kernel for the CodeAct framework.
 It allows for the execution of code with persistent state.
 """
+import ctypes
+import queue
 import threading
 import time
 import sys
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from functools import lru_cache
 from io import StringIO
-from typing import Any, Dict, Optional
-import ast
+from types import CodeType, ModuleType
+from typing import Any, Dict, Optional, TextIO
+
+## Seconds to wait for the worker to unwind after a timeout interrupt.
+INTERRUPT_GRACE_SECONDS = 1.0
+
+## Namespace name of the event background code sets once it is ready.
+READY_EVENT_NAME = "__ready__"
+
+## Seconds to yield to background code that does not signal readiness.
+BACKGROUND_START_DELAY = 0.05
+
+
+@lru_cache(maxsize=512)
+def _compile(code: str) -> CodeType:
+    """Compile code once; agents often resubmit identical snippets."""
+    return compile(code, "<persistent>", "exec")
+
+
+class _CapturingStdout:
+    """Stdout proxy that routes each thread's writes to that thread's capture buffer.
+
+    Every foreground job captures output on its own worker thread, so
+    concurrent kernels never mix their output. Threads started while a
+    buffer is active inherit it, which captures prints from threads spawned
+    by the executed code. Threads without a buffer, such as the caller and
+    background servers, write to the wrapped stream.
+    """
+
+    def __init__(self, stream: TextIO) -> None:
+        self._stream = stream
+        self._buffers: Dict[int, TextIO] = {}
+
+    def capture(self, buffer: Optional[TextIO]) -> None:
+        """Set or clear the capture buffer of the current thread."""
+        if buffer is None:
+            self._buffers.pop(threading.get_ident(), None)
+        else:
+            self._buffers[threading.get_ident()] = buffer
+
+    def current(self) -> Optional[TextIO]:
+        """Return the capture buffer of the current thread, if any."""
+        return self._buffers.get(threading.get_ident())
+
+    def _target(self) -> TextIO:
+        return self._buffers.get(threading.get_ident(), self._stream)
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def flush(self) -> None:
+        self._target().flush()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._target(), name)
+
+
+_thread_start = threading.Thread.start
+
+
+def _start_with_inherited_capture(thread: threading.Thread) -> None:
+    """Start a thread that writes to the capture buffer of the thread starting it."""
+    stdout = sys.stdout
+    buffer = stdout.current() if isinstance(stdout, _CapturingStdout) else None
+    if buffer is not None:
+        run = thread.run
+
+        def run_captured() -> None:
+            stdout.capture(buffer)
+            try:
+                run()
+            finally:
+                stdout.capture(None)
+
+        thread.run = run_captured
+    _thread_start(thread)
+
+
+def _install_stdout_proxy() -> _CapturingStdout:
+    """Install the capturing stdout proxy unless it is already in place."""
+    if not isinstance(sys.stdout, _CapturingStdout):
+        sys.stdout = _CapturingStdout(sys.stdout)
+        threading.Thread.start = _start_with_inherited_capture
+    return sys.stdout
+
+
+_install_stdout_proxy()
+
 
 class PersistentKernel:
     """Persistent Kernel for CodeAct framework."""
@@ -19,34 +109,66 @@ class PersistentKernel:
         Args:
             namespace: Optional initial namespace.
             imports: String containing import statements to execute initially.
+                If it imports numba, the compiled helpers from numba_helpers
+                are added to the namespace as well.
             timeout: Maximum execution time in seconds for code (default 30).
         """
         self.namespace: Dict[str, Any] = namespace or {}
         self.imports = imports
         self.timeout = timeout
         self.background_threads = []
+        ## Serializes foreground executions so concurrent tool calls can share the kernel
+        self._lock = threading.Lock()
+        ## Long-lived worker thread that runs foreground executions
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = self._start_worker()
 
-        if self.imports:
-            self._safe_exec(self.imports)
+        self._load_imports()
 
     def reset(self) -> None:
         """Reset the kernel namespace, keeping only initial imports."""
         self.namespace.clear()
-        if self.imports:
-            self._safe_exec(self.imports)
+        self._load_imports()
+
+    def _load_imports(self) -> None:
+        """Execute the initial imports, adding numba helpers when numba is imported."""
+        if not self.imports:
+            return
+        self._safe_exec(self.imports)
+        # Look at what the imports bound rather than their text, which may only mention numba
+        if any(isinstance(value, ModuleType) and value.__name__ == "numba" for value in self.namespace.values()):
+            from codeact_retrieval.utils.numba_helpers import HELPERS
+
+            self.namespace.update(HELPERS)
 
     def execute_background(self, code: str) -> Dict[str, Any]:
-        """Execute code in a background thread (useful for servers)."""
+        """Execute code in a background thread (useful for servers).
+
+        Code that references ``__ready__`` should call ``__ready__.set()`` once
+        it is ready (e.g. the server is listening); this waits for that signal
+        for up to the kernel timeout. Other code is only given a brief moment
+        to start.
+        """
+        ready_event = threading.Event()
+        self.namespace[READY_EVENT_NAME] = ready_event
+
         def run_code():
+            # Never capture background output, even if started from captured code
+            _install_stdout_proxy().capture(None)
             try:
                 self._safe_exec(code)
             except Exception as e:
                 print(f"Background execution error: {e}")
+            finally:
+                ready_event.set()  # Stop waiting if the code exits before signalling
 
         thread = threading.Thread(target=run_code, daemon=True)
         thread.start()
         self.background_threads.append(thread)
-        time.sleep(2)  # Give the server a moment to start
+        if READY_EVENT_NAME in code:
+            ready_event.wait(timeout=self.timeout)
+        else:
+            time.sleep(BACKGROUND_START_DELAY)
 
         # Clean up finished threads
         self.background_threads = [t for t in self.background_threads if t.is_alive()]
@@ -58,7 +180,10 @@ class PersistentKernel:
         }
 
     def execute(self, code: str) -> Dict[str, Any]:
-        """Execute the given code in the persistent kernel with a timeout."""
+        """Execute the given code in the persistent kernel with a timeout.
+
+        Safe to call from multiple threads; executions run one at a time.
+        """
         if not isinstance(code, str):
             return {
                 "success": False,
@@ -66,21 +191,33 @@ class PersistentKernel:
                 "error": "Code must be a string",
             }
 
-        old_stdout = sys.stdout
+        with self._lock:
+            return self._execute(code)
+
+    def _execute(self, code: str) -> Dict[str, Any]:
+        """Execute code on the worker with stdout captured; callers must hold the lock."""
         captured_output = StringIO()
-        sys.stdout = captured_output
+        future: Future = Future()
+        self._queue.put((code, captured_output, future))
 
         try:
-            exec_thread = threading.Thread(target=self._safe_exec, args=(code,))
-            exec_thread.start()
-            exec_thread.join(timeout=self.timeout)
-
-            if exec_thread.is_alive():
-                raise TimeoutError(f"Execution timed out after {self.timeout} seconds")
-
+            future.result(timeout=self.timeout)
             output = captured_output.getvalue()
             return {"success": True, "output": output, "error": None}
 
+        except FutureTimeoutError:
+            self._interrupt_worker(future)
+            return {
+                "success": False,
+                "output": captured_output.getvalue(),
+                "error": f"Execution timed out after {self.timeout} seconds",
+            }
+
+        except KeyboardInterrupt:
+            # Ctrl-C in the caller: stop the running code, then let the interrupt through
+            self._interrupt_worker(future)
+            raise
+
         except Exception as e:
             return {
                 "success": False,
@@ -88,17 +225,65 @@ class PersistentKernel:
                 "error": str(e),
             }
 
+    def _start_worker(self) -> threading.Thread:
+        """Start a daemon worker thread consuming the current job queue."""
+        worker = threading.Thread(target=self._run_loop, args=(self._queue,), daemon=True)
+        worker.start()
+        return worker
+
+    def _run_loop(self, jobs: "queue.Queue") -> None:
+        """Run queued executions one at a time, reporting through their futures."""
+        while True:
+            future = None
+            try:
+                code, captured_output, future = jobs.get()
+                if future.set_running_or_notify_cancel():
+                    self._run_job(code, captured_output, future)
+            except KeyboardInterrupt:
+                # Timeout interrupt that landed outside user code; keep the worker alive
+                if future is not None and future.running():
+                    future.set_exception(TimeoutError("Execution interrupted"))
+
+    def _run_job(self, code: str, captured_output: StringIO, future: Future) -> None:
+        """Execute one job with stdout captured, resolving its future."""
+        stdout = _install_stdout_proxy()
+        stdout.capture(captured_output)
+        try:
+            self._safe_exec(code)
+        except Exception as e:
+            future.set_exception(e)
+        except BaseException as e:
+            # SystemExit, KeyboardInterrupt etc. must not propagate into the caller
+            future.set_exception(RuntimeError(f"Execution raised {type(e).__name__}"))
+        else:
+            future.set_result(None)
         finally:
-            sys.stdout = old_stdout
+            stdout.capture(None)
+
+    def _interrupt_worker(self, future: Future) -> None:
+        """Interrupt a timed out or cancelled execution, replacing the worker if it does not stop."""
+        if future.done() or future.cancel():
+            return
+
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_ulong(self._worker.ident), ctypes.py_object(KeyboardInterrupt)
+        )
+        try:
+            future.exception(timeout=INTERRUPT_GRACE_SECONDS)
+        except FutureTimeoutError:
+            # Worker is stuck outside Python bytecode; abandon it and start a fresh one.
+            # Its capture is per thread, so anything it prints later stays in its own buffer.
+            self._queue = queue.Queue()
+            self._worker = self._start_worker()
 
     def _safe_exec(self, code: str) -> None:
         """Safely execute code after basic security checks."""
         try:
-            ast.parse(code)  # Basic syntax check
+            code_obj = _compile(code)  # Also validates syntax
         except SyntaxError as e:
             raise SyntaxError(f"Invalid Python syntax: {e}")
 
-        exec(code, self.namespace)
+        exec(code_obj, self.namespace)
 
 if __name__ == "__main__":
     # Example usage
@@ -117,7 +302,9 @@ if __name__ == "__main__":
     print("Example 3 result:", result)
 
     # Example 4: Background execution
-    result = kernel.execute_background("import time\nwhile True: print('Background task running'); time.sleep(5)")
+    result = kernel.execute_background(
+        "import time\n__ready__.set()\nwhile True: print('Background task running'); time.sleep(5)"
+    )
     print("Example 4 result:", result)
 
     # Wait a bit to see background execution
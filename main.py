@@ -1,8 +1,5 @@
 import os
 import sys
-from dotenv import load_dotenv
-from codeact_retrieval.agent import Agent
-from codeact_retrieval.functions import FUNCTIONS
 from codeact_retrieval.tools.tools_schema import TOOLS_SCHEMA
 from codeact_retrieval.utils.prompts import system_prompt
 from codeact_retrieval.utils.persistent_kernel import PersistentKernel
@@ -10,6 +7,11 @@ from codeact_retrieval.utils.persistent_kernel import PersistentKernel
 
 def initialize_agent():
     """Initialize the CodeAct agent with configuration."""
+    ## heavy imports are deferred until the agent is actually needed
+    from dotenv import load_dotenv
+    from codeact_retrieval.agent import Agent
+    from codeact_retrieval.functions import FUNCTIONS
+
     load_dotenv()
     ## api key for anthropic
     api_key = os.getenv("ANTHROPIC_API_KEY")
@@ -20,7 +22,7 @@ def initialize_agent():
 
     ## return agent with anthropic model
     return Agent(
-        model="claude-4-sonnet-20250514",
+        model="claude-sonnet-4-20250514",
         api_key=api_key,
         system_prompt=system_prompt,
         base_url="https://api.anthropic.com/v1",
@@ -58,13 +60,11 @@ if __name__ == "__main__":
         
         print("\nProcessing your query...\n")
         
-        response = agent.query(user_prompt)
-        
-        # Display the final output
+        # Display the output as it streams in
         print("\n" + "=" * 50)
-        print("FINAL OUTPUT:")
+        print("OUTPUT:")
         print("=" * 50)
-        if response.get("content"):
-            print(response.get("content"))
-        print("=" * 50 + "\n")
+        for text in agent.query_stream(user_prompt):
+            print(text, end="", flush=True)
+        print("\n" + "=" * 50 + "\n")
         
\ No newline at end of file